@@ -9,32 +9,75 @@ import streamlit as st
 import json
 import re
 import os
+import sys
 from pathlib import Path
-from datetime import datetime
-from typing import Dict, List, Any, Optional, Set
-from dataclasses import dataclass, field, asdict
-from collections import Counter
-import zipfile
-import io
-
-# Try imports
-try:
-    import anthropic
-    HAS_ANTHROPIC = True
-except ImportError:
-    HAS_ANTHROPIC = False
+from typing import Dict, List, Any, Optional, Set, Iterator
+from dataclasses import dataclass, field
+from collections import Counter, OrderedDict
+from operator import attrgetter
+import heapq
+import hashlib
+import itertools
+import uuid
+import importlib.util
+import logging
+import threading
+import queue
+import contextlib
+
+# Optional clients are only probed here; they're imported on first API call so
+# sessions that never reach Claude don't pay for anthropic/httpx/pydantic at startup
+HAS_ANTHROPIC = importlib.util.find_spec("anthropic") is not None
+HAS_REQUESTS = importlib.util.find_spec("requests") is not None
 
 try:
-    import requests
-    HAS_REQUESTS = True
+    import orjson
+    HAS_ORJSON = True
 except ImportError:
-    HAS_REQUESTS = False
+    HAS_ORJSON = False
+
+
+def _dumps(obj) -> bytes:
+    """Pretty JSON as UTF-8 bytes, via orjson when installed"""
+    if HAS_ORJSON:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2).encode()
+
+
+def _loads(data):
+    """Parse JSON from str or bytes, via orjson when installed"""
+    if HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# ============================================================================
+# COMPILED PATTERNS
+# ============================================================================
+
+_TAG_RE = re.compile(r'@([\w-]+)')
+_SCENARIO_HEADER_RE = re.compile(r'^Scenario( Outline)?:')
+_STEP_RE = re.compile(r'^\* |^Given |^When |^Then |^And |^But ')
+_VAR_DEF_RE = re.compile(r'\* def (\w+)\s*=\s*(.+)')
+_TEMPLATE_NAME_RE = re.compile(r"templateName\s*=\s*['\"]([^'\"]+)['\"]")
+_RESPONSE_CODE_RE = re.compile(r"DE39['\"]?\s*==\s*['\"]?(\d{2})['\"]?")
+_FIELD_RE = re.compile(r'(DE\d+)[:\s=]+[\'"]?([^\'"\s,}]+)')
+_QUOTED_RE = re.compile(r'["\'][^"\']+["\']')
+_LONG_NUMBER_RE = re.compile(r'\d{4,}')
+_WORD_RE = re.compile(r'\w+')
+_DE39_ASSERT_RE = re.compile(r"DE39.*?==.*?'\d+'")
+
+_NEGATIVE_TAGS = frozenset({'negative', 'decline'})
+_NON_DECLINE_CODES = frozenset({'00', ''})
 
 # ============================================================================
 # DATA MODELS
 # ============================================================================
 
-@dataclass
+# Knowledge-base records are held in bulk and read often; drop their per-instance
+# __dict__ where the interpreter supports slotted dataclasses (3.10+)
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**_SLOTS)
 class TransactionTemplate:
     id: str
     name: str
@@ -47,18 +90,29 @@ class TransactionTemplate:
     tags: List[str] = field(default_factory=list)
     icon: str = "💳"
     
+    def __post_init__(self):
+        # Low-cardinality labels compared all over the app; intern for identity compares
+        self.category = sys.intern(self.category)
+        self.card_network = sys.intern(self.card_network)
+        self.message_type = sys.intern(self.message_type)
+    
     def to_dict(self):
-        return asdict(self)
+        return {"id": self.id, "name": self.name, "description": self.description, "category": self.category,
+                "card_network": self.card_network, "message_type": self.message_type,
+                "processing_code": self.processing_code, "fields": self.fields, "tags": self.tags, "icon": self.icon}
 
-@dataclass
+@dataclass(**_SLOTS)
 class ResponseCode:
     code: str
     message: str
     category: str
     trigger_field: str = ""
     trigger_value: str = ""
+    
+    def __post_init__(self):
+        self.category = sys.intern(self.category)
 
-@dataclass 
+@dataclass(**_SLOTS)
 class SQLTable:
     name: str
     description: str
@@ -76,8 +130,18 @@ class LearnedScenario:
     response_code: str = ""
     has_sql: bool = False
     has_common_calls: bool = False
+    
+    def __post_init__(self):
+        self.response_code = sys.intern(self.response_code)
+        # Lowercased text for similarity search, built once instead of per query
+        self.search_text = (self.name + ' ' + ' '.join(self.tags) + ' ' + self.content).lower()
+    
+    def to_dict(self):
+        return {"name": self.name, "tags": self.tags, "content": self.content, "file_path": self.file_path,
+                "template_used": self.template_used, "response_code": self.response_code,
+                "has_sql": self.has_sql, "has_common_calls": self.has_common_calls}
 
-@dataclass
+@dataclass(**_SLOTS)
 class LearnedPattern:
     """A reusable pattern learned from your code"""
     pattern_type: str  # background, step, assertion, sql, call
@@ -89,6 +153,15 @@ class LearnedPattern:
 # REPOSITORY SCANNER
 # ============================================================================
 
+def _is_int(value) -> bool:
+    # bool is an int subclass, but true/false is not a valid count
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_str_list(value) -> bool:
+    return isinstance(value, list) and all(isinstance(v, str) for v in value)
+
+
 class RepositoryScanner:
     """Scans repository to learn all Karate patterns"""
     
@@ -104,11 +177,19 @@ class RepositoryScanner:
             "variables": [],
             "tags": [],
         }
+        # content -> pattern per type, so counting a repeat is one dict probe
+        self._pattern_index: Dict[str, Dict[str, LearnedPattern]] = {k: {} for k in self.patterns}
         self.templates_used: Counter = Counter()
         self.response_codes_used: Counter = Counter()
         self.field_mappings: Dict[str, Set[str]] = {}
         self.common_imports: List[str] = []
         self.config_patterns: List[str] = []
+        # Rendered Claude context per max_examples, cleared whenever learned data changes
+        self._context_cache: Dict[int, str] = {}
+        self._export_cache: Optional[bytes] = None
+        # Random per change, never a counter that a cache clear could reset, so it can
+        # key caches shared between sessions without aliasing another scanner's data
+        self.version = uuid.uuid4().bytes
         
     def scan_directory(self, base_path: str, progress_callback=None) -> Dict:
         """Scan a directory for all .feature files"""
@@ -157,6 +238,7 @@ class RepositoryScanner:
     
     def scan_zip_file(self, zip_file, progress_callback=None) -> Dict:
         """Scan a ZIP file containing feature files"""
+        import zipfile  # pulls in bz2/lzma, only needed for ZIP uploads
         results = {"files": 0, "scenarios": 0, "patterns": 0}
         
         with zipfile.ZipFile(zip_file, 'r') as zf:
@@ -215,7 +297,7 @@ class RepositoryScanner:
             
             # Tags
             if stripped.startswith('@'):
-                tags = re.findall(r'@([\w-]+)', stripped)
+                tags = _TAG_RE.findall(stripped)
                 current_tags = tags
                 for tag in tags:
                     self._add_pattern("tags", tag, file_path)
@@ -238,7 +320,7 @@ class RepositoryScanner:
                     self._save_scenario(current_scenario_name, current_tags, current_content, file_path)
                 
                 current_section = 'scenario'
-                current_scenario_name = re.sub(r'^Scenario( Outline)?:', '', stripped).strip()
+                current_scenario_name = _SCENARIO_HEADER_RE.sub('', stripped).strip()
                 current_content = []
                 feature_info["tags"].extend(current_tags)
                 continue
@@ -253,12 +335,19 @@ class RepositoryScanner:
             self._save_scenario(current_scenario_name, current_tags, current_content, file_path)
         
         self.feature_files.append(feature_info)
+        self._mark_changed()
+    
+    def _mark_changed(self):
+        """Invalidate anything derived from the learned data"""
+        self._context_cache.clear()
+        self._export_cache = None
+        self.version = uuid.uuid4().bytes
     
     def _analyze_line(self, line: str, file_path: str):
         """Analyze a single line for patterns"""
         
         # Steps
-        if re.match(r'^\* |^Given |^When |^Then |^And |^But ', line):
+        if _STEP_RE.match(line):
             normalized = self._normalize_step(line)
             self._add_pattern("steps", normalized, file_path)
         
@@ -275,22 +364,22 @@ class RepositoryScanner:
             self._add_pattern("calls", line.strip(), file_path)
         
         # Variables
-        var_match = re.match(r'\* def (\w+)\s*=\s*(.+)', line)
+        var_match = _VAR_DEF_RE.match(line)
         if var_match:
             self._add_pattern("variables", line.strip(), file_path)
         
         # Template references
-        template_match = re.search(r"templateName\s*=\s*['\"]([^'\"]+)['\"]", line)
+        template_match = _TEMPLATE_NAME_RE.search(line)
         if template_match:
             self.templates_used[template_match.group(1)] += 1
         
         # Response codes
-        rc_match = re.search(r"DE39['\"]?\s*==\s*['\"]?(\d{2})['\"]?", line)
+        rc_match = _RESPONSE_CODE_RE.search(line)
         if rc_match:
             self.response_codes_used[rc_match.group(1)] += 1
         
         # Field mappings
-        field_matches = re.findall(r'(DE\d+)[:\s=]+[\'"]?([^\'"\s,}]+)', line)
+        field_matches = _FIELD_RE.findall(line)
         for field, value in field_matches:
             if field not in self.field_mappings:
                 self.field_mappings[field] = set()
@@ -298,31 +387,34 @@ class RepositoryScanner:
     
     def _normalize_step(self, step: str) -> str:
         """Normalize a step for pattern matching"""
-        normalized = re.sub(r'["\'][^"\']+["\']', '"{value}"', step)
-        normalized = re.sub(r'\d{4,}', '{number}', normalized)
+        normalized = _QUOTED_RE.sub('"{value}"', step)
+        normalized = _LONG_NUMBER_RE.sub('{number}', normalized)
         return normalized.strip()
     
     def _add_pattern(self, pattern_type: str, content: str, file_path: str):
         """Add or update a pattern"""
-        for p in self.patterns[pattern_type]:
-            if p.content == content:
-                p.frequency += 1
-                return
+        index = self._pattern_index[pattern_type]
+        existing = index.get(content)
+        if existing is not None:
+            existing.frequency += 1
+            return
         
-        self.patterns[pattern_type].append(LearnedPattern(
+        pattern = LearnedPattern(
             pattern_type=pattern_type,
             content=content,
             frequency=1,
             example_file=file_path
-        ))
+        )
+        self.patterns[pattern_type].append(pattern)
+        index[content] = pattern
     
     def _save_scenario(self, name: str, tags: List[str], content: List[str], file_path: str):
         """Save a learned scenario"""
         content_str = '\n'.join(content)
         
         # Detect characteristics
-        template_match = re.search(r"templateName\s*=\s*['\"]([^'\"]+)['\"]", content_str)
-        rc_match = re.search(r"DE39['\"]?\s*==\s*['\"]?(\d{2})['\"]?", content_str)
+        template_match = _TEMPLATE_NAME_RE.search(content_str)
+        rc_match = _RESPONSE_CODE_RE.search(content_str)
         
         scenario = LearnedScenario(
             name=name,
@@ -337,6 +429,10 @@ class RepositoryScanner:
         
         self.scenarios.append(scenario)
     
+    def top_patterns(self, pattern_type: str, limit: int) -> List[LearnedPattern]:
+        """Most frequent patterns of a type, without sorting the whole list"""
+        return heapq.nlargest(limit, self.patterns[pattern_type], key=attrgetter("frequency"))
+    
     def get_summary(self) -> Dict:
         """Get summary of learned patterns"""
         return {
@@ -355,66 +451,73 @@ class RepositoryScanner:
         }
     
     def get_context_for_claude(self, max_examples: int = 5) -> str:
+        """Comprehensive context for Claude, rebuilt only after new data is learned"""
+        context = self._context_cache.get(max_examples)
+        if context is None:
+            context = self._context_cache[max_examples] = self._build_context_for_claude(max_examples)
+        return context
+    
+    def _build_context_for_claude(self, max_examples: int) -> str:
         """Build comprehensive context for Claude"""
-        context = "# LEARNED FROM YOUR REPOSITORY\n\n"
+        parts = ["# LEARNED FROM YOUR REPOSITORY\n\n"]
         
         # Summary
         summary = self.get_summary()
-        context += f"""## Repository Summary
+        parts.append(f"""## Repository Summary
 - Total Feature Files: {summary['total_files']}
 - Total Scenarios: {summary['total_scenarios']}
 - Unique Step Patterns: {summary['unique_steps']}
 - SQL Patterns: {summary['sql_queries']}
 - Unique Tags: {summary['unique_tags']}
 
-"""
+""")
         
         # Most used templates
         if self.templates_used:
-            context += "## Templates Used (by frequency)\n"
+            parts.append("## Templates Used (by frequency)\n")
             for template, count in self.templates_used.most_common(10):
-                context += f"- {template}: {count} times\n"
-            context += "\n"
+                parts.append(f"- {template}: {count} times\n")
+            parts.append("\n")
         
         # Response codes
         if self.response_codes_used:
-            context += "## Response Codes Used (by frequency)\n"
+            parts.append("## Response Codes Used (by frequency)\n")
             for rc, count in self.response_codes_used.most_common(10):
-                context += f"- RC {rc}: {count} times\n"
-            context += "\n"
+                parts.append(f"- RC {rc}: {count} times\n")
+            parts.append("\n")
         
         # Background patterns
         if self.patterns["backgrounds"]:
-            context += "## Common Background Patterns\n"
-            for bg in sorted(self.patterns["backgrounds"], key=lambda x: -x.frequency)[:3]:
-                context += f"```gherkin\nBackground:\n{bg.content[:500]}\n```\n\n"
+            parts.append("## Common Background Patterns\n")
+            for bg in self.top_patterns("backgrounds", 3):
+                parts.append(f"```gherkin\nBackground:\n{bg.content[:500]}\n```\n\n")
         
         # Most common steps
-        context += "## Most Common Step Patterns\n"
-        for step in sorted(self.patterns["steps"], key=lambda x: -x.frequency)[:15]:
-            context += f"- ({step.frequency}x) `{step.content[:100]}`\n"
-        context += "\n"
+        parts.append("## Most Common Step Patterns\n")
+        for step in self.top_patterns("steps", 15):
+            parts.append(f"- ({step.frequency}x) `{step.content[:100]}`\n")
+        parts.append("\n")
         
         # SQL patterns
         if self.patterns["sql_queries"]:
-            context += "## SQL Query Patterns\n"
-            for sql in sorted(self.patterns["sql_queries"], key=lambda x: -x.frequency)[:5]:
-                context += f"```\n{sql.content}\n```\n"
-            context += "\n"
+            parts.append("## SQL Query Patterns\n")
+            for sql in self.top_patterns("sql_queries", 5):
+                parts.append(f"```\n{sql.content}\n```\n")
+            parts.append("\n")
         
         # Call patterns
         if self.patterns["calls"]:
-            context += "## Common Scenario Calls\n"
-            for call in sorted(self.patterns["calls"], key=lambda x: -x.frequency)[:5]:
-                context += f"- `{call.content}`\n"
-            context += "\n"
+            parts.append("## Common Scenario Calls\n")
+            for call in self.top_patterns("calls", 5):
+                parts.append(f"- `{call.content}`\n")
+            parts.append("\n")
         
         # Example scenarios (most representative)
-        context += "## Example Scenarios From Your Repository\n"
+        parts.append("## Example Scenarios From Your Repository\n")
         # Get diverse examples
         examples = self._get_diverse_examples(max_examples)
         for i, scenario in enumerate(examples, 1):
-            context += f"""
+            parts.append(f"""
 ### Example {i}: {scenario.name}
 - Tags: {', '.join(scenario.tags)}
 - Template: {scenario.template_used or 'N/A'}
@@ -428,73 +531,90 @@ Scenario: {scenario.name}
 {"..." if len(scenario.content) > 800 else ""}
 ```
 
-"""
+""")
         
         # Field mappings
         if self.field_mappings:
-            context += "## Field Mappings Discovered\n"
+            parts.append("## Field Mappings Discovered\n")
             for field, values in sorted(self.field_mappings.items()):
-                sample_values = list(values)[:3]
-                context += f"- {field}: {', '.join(sample_values)}\n"
+                parts.append(f"- {field}: {', '.join(itertools.islice(values, 3))}\n")
         
-        return context
+        return "".join(parts)
+    
+    @staticmethod
+    def _scenario_key(scenario: LearnedScenario) -> tuple:
+        """Hashable identity of a scenario, so repeated scans of a file dedupe"""
+        return (scenario.file_path, scenario.name, scenario.content)
     
     def _get_diverse_examples(self, count: int) -> List[LearnedScenario]:
         """Get diverse example scenarios"""
         examples = []
+        chosen = set()
         
         # Get one with SQL
-        sql_scenarios = [s for s in self.scenarios if s.has_sql]
-        if sql_scenarios:
-            examples.append(sql_scenarios[0])
+        sql_scenario = next((s for s in self.scenarios if s.has_sql), None)
+        if sql_scenario:
+            examples.append(sql_scenario)
+            chosen.add(self._scenario_key(sql_scenario))
         
         # Get one with common calls
-        call_scenarios = [s for s in self.scenarios if s.has_common_calls and s not in examples]
-        if call_scenarios:
-            examples.append(call_scenarios[0])
+        call_scenario = next((s for s in self.scenarios
+                              if s.has_common_calls and self._scenario_key(s) not in chosen), None)
+        if call_scenario:
+            examples.append(call_scenario)
+            chosen.add(self._scenario_key(call_scenario))
         
         # Get different response codes
         seen_rcs = set()
         for s in self.scenarios:
-            if s.response_code and s.response_code not in seen_rcs and s not in examples:
+            if len(examples) >= count:
+                break
+            key = self._scenario_key(s)
+            if s.response_code and s.response_code not in seen_rcs and key not in chosen:
                 examples.append(s)
+                chosen.add(key)
                 seen_rcs.add(s.response_code)
-                if len(examples) >= count:
-                    break
         
         # Fill remaining
         for s in self.scenarios:
-            if s not in examples:
+            if len(examples) >= count:
+                break
+            key = self._scenario_key(s)
+            if key not in chosen:
                 examples.append(s)
-                if len(examples) >= count:
-                    break
+                chosen.add(key)
         
         return examples[:count]
     
     def find_similar_scenarios(self, prompt: str, limit: int = 3) -> List[LearnedScenario]:
         """Find scenarios similar to the prompt"""
         prompt_lower = prompt.lower()
-        keywords = set(re.findall(r'\w+', prompt_lower))
+        keywords = set(_WORD_RE.findall(prompt_lower))
+        
+        # Prompt intent doesn't change per scenario, so resolve it once
+        wants_negative = 'negative' in prompt_lower
+        wants_e2e = 'e2e' in prompt_lower
+        wants_sql = 'sql' in prompt_lower
+        wants_approved = 'approved' in prompt_lower
+        wants_declined = 'declined' in prompt_lower
         
         scored = []
         for scenario in self.scenarios:
             score = 0
-            scenario_text = (scenario.name + ' ' + ' '.join(scenario.tags) + ' ' + scenario.content).lower()
-            
             for keyword in keywords:
-                if keyword in scenario_text:
+                if keyword in scenario.search_text:
                     score += 1
             
             # Boost for specific matches
-            if 'negative' in prompt_lower and any(t in ['negative', 'decline'] for t in scenario.tags):
+            if wants_negative and not _NEGATIVE_TAGS.isdisjoint(scenario.tags):
                 score += 3
-            if 'e2e' in prompt_lower and 'e2e' in scenario.tags:
+            if wants_e2e and 'e2e' in scenario.tags:
                 score += 3
-            if 'sql' in prompt_lower and scenario.has_sql:
+            if wants_sql and scenario.has_sql:
                 score += 2
-            if 'approved' in prompt_lower and scenario.response_code == '00':
+            if wants_approved and scenario.response_code == '00':
                 score += 2
-            if 'declined' in prompt_lower and scenario.response_code not in ['00', '']:
+            if wants_declined and scenario.response_code not in _NON_DECLINE_CODES:
                 score += 2
             
             scored.append((score, scenario))
@@ -502,12 +622,17 @@ Scenario: {scenario.name}
         scored.sort(key=lambda x: -x[0])
         return [s for _, s in scored[:limit]]
     
-    def export_learned_data(self) -> str:
-        """Export all learned data as JSON"""
+    def export_learned_data(self) -> bytes:
+        """Export all learned data as JSON, encoded once for download"""
+        if self._export_cache is None:
+            self._export_cache = self._build_export()
+        return self._export_cache
+    
+    def _build_export(self) -> bytes:
         data = {
             "summary": self.get_summary(),
             "feature_files": self.feature_files,
-            "scenarios": [asdict(s) for s in self.scenarios],
+            "scenarios": [s.to_dict() for s in self.scenarios],
             "patterns": {
                 k: [{"content": p.content, "frequency": p.frequency} for p in v]
                 for k, v in self.patterns.items()
@@ -516,101 +641,237 @@ Scenario: {scenario.name}
             "response_codes_used": dict(self.response_codes_used),
             "field_mappings": {k: list(v) for k, v in self.field_mappings.items()},
         }
-        return json.dumps(data, indent=2)
+        return _dumps(data)
     
-    def import_learned_data(self, json_str: str):
-        """Import previously learned data"""
-        data = json.loads(json_str)
-        
-        self.feature_files = data.get("feature_files", [])
-        self.templates_used = Counter(data.get("templates_used", {}))
-        self.response_codes_used = Counter(data.get("response_codes_used", {}))
-        self.field_mappings = {k: set(v) for k, v in data.get("field_mappings", {}).items()}
+    @staticmethod
+    def _checked(data: Dict, key: str, kind: type):
+        """data[key], defaulting to empty, after checking its JSON type"""
+        value = data.get(key, kind())
+        if not isinstance(value, kind):
+            raise ValueError(f"{key} must be a JSON {'array' if kind is list else 'object'}")
+        return value
+    
+    @classmethod
+    def _checked_counts(cls, data: Dict, key: str) -> Dict:
+        counts = cls._checked(data, key, dict)
+        if not all(_is_int(n) for n in counts.values()):
+            raise ValueError(f"{key} values must be integers")
+        return counts
+    
+    @staticmethod
+    def _checked_scenario(entry) -> LearnedScenario:
+        if not isinstance(entry, dict):
+            raise ValueError("scenarios entries must be JSON objects")
+        for key in ("name", "content", "file_path", "template_used", "response_code"):
+            if not isinstance(entry.get(key, ""), str):
+                raise ValueError(f"scenario {key} must be a string")
+        if not _is_str_list(entry.get("tags", [])):
+            raise ValueError("scenario tags must be a list of strings")
+        for key in ("has_sql", "has_common_calls"):
+            if not isinstance(entry.get(key, False), bool):
+                raise ValueError(f"scenario {key} must be true or false")
+        return LearnedScenario(**entry)
+    
+    def import_learned_data(self, raw):
+        """Import previously learned data from JSON text or bytes"""
+        # Rebuild everything before touching the scanner, so a malformed file
+        # (ValueError, KeyError or TypeError) leaves the learned data unchanged
+        data = _loads(raw)
+        if not isinstance(data, dict):
+            raise ValueError("expected a JSON object")
+        
+        feature_files = self._checked(data, "feature_files", list)
+        templates_used = Counter(self._checked_counts(data, "templates_used"))
+        response_codes_used = Counter(self._checked_counts(data, "response_codes_used"))
+        field_mappings = self._checked(data, "field_mappings", dict)
+        if not all(_is_str_list(v) for v in field_mappings.values()):
+            raise ValueError("field_mappings values must be lists of strings")
+        field_mappings = {k: set(v) for k, v in field_mappings.items()}
         
         # Reconstruct scenarios
-        for s in data.get("scenarios", []):
-            self.scenarios.append(LearnedScenario(**s))
+        scenarios = [self._checked_scenario(s) for s in self._checked(data, "scenarios", list)]
         
         # Reconstruct patterns
-        for pattern_type, patterns in data.get("patterns", {}).items():
-            for p in patterns:
-                self.patterns[pattern_type].append(LearnedPattern(
+        patterns = []
+        for pattern_type, entries in self._checked(data, "patterns", dict).items():
+            if pattern_type not in self.patterns:
+                raise ValueError(f"unknown pattern type: {pattern_type}")
+            if not isinstance(entries, list):
+                raise ValueError(f"patterns.{pattern_type} must be a list")
+            for p in entries:
+                pattern = LearnedPattern(
                     pattern_type=pattern_type,
                     content=p["content"],
                     frequency=p["frequency"]
-                ))
+                )
+                if not isinstance(pattern.content, str) or not _is_int(pattern.frequency):
+                    raise ValueError(f"patterns.{pattern_type} needs string content and an integer frequency")
+                patterns.append(pattern)
+        
+        self.feature_files = feature_files
+        self.templates_used = templates_used
+        self.response_codes_used = response_codes_used
+        self.field_mappings = field_mappings
+        self.scenarios.extend(scenarios)
+        for pattern in patterns:
+            self.patterns[pattern.pattern_type].append(pattern)
+            self._pattern_index[pattern.pattern_type].setdefault(pattern.content, pattern)
+        
+        self._mark_changed()
 
 # ============================================================================
 # KNOWLEDGE BASE
 # ============================================================================
 
+# Built once at import; the records are never mutated, so every KnowledgeBase shares them
+_DEFAULT_TEMPLATES = (
+    TransactionTemplate("visa_purchase_0100", "fwd_visasig_direct_purchase_0100", "Visa Signature Purchase", "purchase", "visa", "0100", "000000",
+        {"DMTI": "0100", "DE2": "4144779500060809", "DE3": "000000", "DE4": "000000000700", "DE11": "{stan}", "DE14": "2512", "DE37": "{rrn}", "DE41": "TERMID01", "DE42": "MERCHANT01"},
+        ["visa", "purchase", "signature"], "💳"),
+    TransactionTemplate("mastercard_purchase_0100", "fwd_mastercard_purchase_0100", "MasterCard Purchase", "purchase", "mastercard", "0100", "000000",
+        {"DMTI": "0100", "DE2": "5500000000000004", "DE3": "000000", "DE4": "000000001000", "DE11": "{stan}", "DE14": "2512", "DE37": "{rrn}", "DE41": "TERMID02"},
+        ["mastercard", "purchase"], "💳"),
+    TransactionTemplate("visa_atm_0100", "fwd_visa_atm_withdrawal_0100", "Visa ATM Withdrawal", "withdrawal", "visa", "0100", "010000",
+        {"DMTI": "0100", "DE2": "4111111111111111", "DE3": "010000", "DE4": "000000005000", "DE11": "{stan}", "DE37": "{rrn}", "DE41": "ATM00001"},
+        ["visa", "atm", "withdrawal"], "🏧"),
+    TransactionTemplate("visa_refund_0100", "fwd_visa_refund_0100", "Visa Refund", "refund", "visa", "0100", "200000",
+        {"DMTI": "0100", "DE2": "4144779500060809", "DE3": "200000", "DE4": "000000000500", "DE11": "{stan}", "DE37": "{rrn}", "DE41": "TERMID01"},
+        ["visa", "refund"], "↩️"),
+)
+
+_DEFAULT_CODES = (
+    ResponseCode("00", "Approved", "approved"),
+    ResponseCode("05", "Do Not Honor", "declined"),
+    ResponseCode("14", "Invalid Card", "declined", "DE2", "1234567890123456"),
+    ResponseCode("51", "Insufficient Funds", "declined", "DE4", "999999999999"),
+    ResponseCode("54", "Expired Card", "declined", "DE14", "2001"),
+    ResponseCode("55", "Invalid PIN", "declined"),
+    ResponseCode("61", "Exceeds Limit", "declined", "DE4", "500000000000"),
+)
+
+_DEFAULT_SQL_TABLES = (
+    SQLTable("PPH_TRAN", "Payment Hub Transaction",
+        {"TRAN_ID": {"type": "VARCHAR2(36)"}, "TXN_STATUS": {"type": "VARCHAR2(20)"}, "RESP_CODE": {"type": "VARCHAR2(2)"}, "RRN": {"type": "VARCHAR2(12)"}, "STAN": {"type": "VARCHAR2(6)"}},
+        ["RRN", "STAN"]),
+    SQLTable("PPDSVA", "Value Added Data",
+        {"SVA_ID": {"type": "VARCHAR2(36)"}, "FRAUD_CHECK": {"type": "VARCHAR2(10)"}, "HOST_RESP_CODE": {"type": "VARCHAR2(4)"}},
+        ["RRN", "STAN"]),
+)
+
+
 class KnowledgeBase:
+    __slots__ = ("templates", "response_codes", "sql_tables", "_context_cache")
+    
     def __init__(self):
         self.templates: Dict[str, TransactionTemplate] = {}
         self.response_codes: Dict[str, ResponseCode] = {}
         self.sql_tables: Dict[str, SQLTable] = {}
+        self._context_cache: Optional[str] = None
         self._load_defaults()
     
     def _load_defaults(self):
-        templates = [
-            TransactionTemplate("visa_purchase_0100", "fwd_visasig_direct_purchase_0100", "Visa Signature Purchase", "purchase", "visa", "0100", "000000",
-                {"DMTI": "0100", "DE2": "4144779500060809", "DE3": "000000", "DE4": "000000000700", "DE11": "{stan}", "DE14": "2512", "DE37": "{rrn}", "DE41": "TERMID01", "DE42": "MERCHANT01"},
-                ["visa", "purchase", "signature"], "💳"),
-            TransactionTemplate("mastercard_purchase_0100", "fwd_mastercard_purchase_0100", "MasterCard Purchase", "purchase", "mastercard", "0100", "000000",
-                {"DMTI": "0100", "DE2": "5500000000000004", "DE3": "000000", "DE4": "000000001000", "DE11": "{stan}", "DE14": "2512", "DE37": "{rrn}", "DE41": "TERMID02"},
-                ["mastercard", "purchase"], "💳"),
-            TransactionTemplate("visa_atm_0100", "fwd_visa_atm_withdrawal_0100", "Visa ATM Withdrawal", "withdrawal", "visa", "0100", "010000",
-                {"DMTI": "0100", "DE2": "4111111111111111", "DE3": "010000", "DE4": "000000005000", "DE11": "{stan}", "DE37": "{rrn}", "DE41": "ATM00001"},
-                ["visa", "atm", "withdrawal"], "🏧"),
-            TransactionTemplate("visa_refund_0100", "fwd_visa_refund_0100", "Visa Refund", "refund", "visa", "0100", "200000",
-                {"DMTI": "0100", "DE2": "4144779500060809", "DE3": "200000", "DE4": "000000000500", "DE11": "{stan}", "DE37": "{rrn}", "DE41": "TERMID01"},
-                ["visa", "refund"], "↩️"),
-        ]
-        for t in templates:
-            self.templates[t.id] = t
-        
-        codes = [
-            ResponseCode("00", "Approved", "approved"),
-            ResponseCode("05", "Do Not Honor", "declined"),
-            ResponseCode("14", "Invalid Card", "declined", "DE2", "1234567890123456"),
-            ResponseCode("51", "Insufficient Funds", "declined", "DE4", "999999999999"),
-            ResponseCode("54", "Expired Card", "declined", "DE14", "2001"),
-            ResponseCode("55", "Invalid PIN", "declined"),
-            ResponseCode("61", "Exceeds Limit", "declined", "DE4", "500000000000"),
-        ]
-        for rc in codes:
-            self.response_codes[rc.code] = rc
-        
-        self.sql_tables["PPH_TRAN"] = SQLTable("PPH_TRAN", "Payment Hub Transaction",
-            {"TRAN_ID": {"type": "VARCHAR2(36)"}, "TXN_STATUS": {"type": "VARCHAR2(20)"}, "RESP_CODE": {"type": "VARCHAR2(2)"}, "RRN": {"type": "VARCHAR2(12)"}, "STAN": {"type": "VARCHAR2(6)"}},
-            ["RRN", "STAN"])
-        
-        self.sql_tables["PPDSVA"] = SQLTable("PPDSVA", "Value Added Data",
-            {"SVA_ID": {"type": "VARCHAR2(36)"}, "FRAUD_CHECK": {"type": "VARCHAR2(10)"}, "HOST_RESP_CODE": {"type": "VARCHAR2(4)"}},
-            ["RRN", "STAN"])
+        self._context_cache = None
+        self.templates.update((t.id, t) for t in _DEFAULT_TEMPLATES)
+        self.response_codes.update((rc.code, rc) for rc in _DEFAULT_CODES)
+        self.sql_tables.update((t.name, t) for t in _DEFAULT_SQL_TABLES)
     
     def get_context(self) -> str:
-        context = "# AVAILABLE CONFIGURATION\n\n"
+        # Sent with every generate call; only rebuilt after the registries are (re)loaded
+        if self._context_cache is None:
+            self._context_cache = self._build_context()
+        return self._context_cache
+    
+    def _build_context(self) -> str:
+        parts = ["# AVAILABLE CONFIGURATION\n\n"]
         
-        context += "## Transaction Templates\n"
+        parts.append("## Transaction Templates\n")
         for t in self.templates.values():
-            context += f"- {t.name}: {t.description} (Category: {t.category}, Network: {t.card_network})\n"
+            parts.append(f"- {t.name}: {t.description} (cat={t.category} net={t.card_network})\n")
         
-        context += "\n## Response Codes\n"
+        parts.append("\n## Response Codes\n")
         for rc in self.response_codes.values():
-            trigger = f" [Trigger: {rc.trigger_field}={rc.trigger_value}]" if rc.trigger_field else ""
-            context += f"- {rc.code}: {rc.message} ({rc.category}){trigger}\n"
+            trigger = f" [trigger {rc.trigger_field}={rc.trigger_value}]" if rc.trigger_field else ""
+            parts.append(f"- {rc.code}: {rc.message} ({rc.category}){trigger}\n")
         
-        context += "\n## SQL Tables\n"
+        parts.append("\n## SQL Tables\n")
         for tbl in self.sql_tables.values():
-            context += f"- {tbl.name}: {tbl.description} (Keys: {', '.join(tbl.key_columns)})\n"
+            parts.append(f"- {tbl.name}: {tbl.description} (keys={','.join(tbl.key_columns)})\n")
         
-        return context
+        return "".join(parts)
 
 # ============================================================================
 # CLAUDE GENERATOR
 # ============================================================================
 
+# ClaudeGenerator is rebuilt on every Generate click and the module itself on every
+# rerun, so the API clients are cache_resource singletons to keep their connection
+# pools (and TLS sessions) alive between calls. The SDK client is safe to share
+# across session threads; requests.Session is not, so those are pooled instead
+
+@st.cache_resource(max_entries=4)
+def _anthropic_client(api_key: str):
+    import anthropic
+    return anthropic.Anthropic(api_key=api_key)
+
+
+@st.cache_resource
+def _http_session_pool() -> "queue.SimpleQueue":
+    """Idle requests sessions, each checked out by one call at a time"""
+    return queue.SimpleQueue()
+
+
+@contextlib.contextmanager
+def _http_session():
+    pool = _http_session_pool()
+    try:
+        session = pool.get_nowait()
+    except queue.Empty:
+        import requests
+        session = requests.Session()
+        session.headers.update({
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json"
+        })
+    try:
+        yield session
+    finally:
+        pool.put(session)
+
+
+class _ResponseCache:
+    """Bounded LRU of finished features keyed by _response_key()"""
+    
+    def __init__(self, size: int = 128):
+        self._size = size
+        self._items: "OrderedDict[bytes, str]" = OrderedDict()
+        # Every session's script thread shares this instance
+        self._lock = threading.Lock()
+    
+    def get(self, key: bytes) -> Optional[str]:
+        with self._lock:
+            feature = self._items.get(key)
+            if feature is not None:
+                self._items.move_to_end(key)
+            return feature
+    
+    def put(self, key: bytes, feature: str):
+        with self._lock:
+            self._items[key] = feature
+            self._items.move_to_end(key)
+            if len(self._items) > self._size:
+                self._items.popitem(last=False)
+
+
+@st.cache_resource
+def _response_cache() -> _ResponseCache:
+    """One cache for all sessions; a module-level dict would reset on every rerun"""
+    return _ResponseCache()
+
+
+# Only successful outputs are cached; failures carry one of these chunks
+_ERROR_PREFIXES = ("# API Error:", "# Error:")
+
+
 class ClaudeGenerator:
     def __init__(self, api_key: str, kb: KnowledgeBase, scanner: RepositoryScanner):
         self.api_key = api_key
@@ -619,18 +880,46 @@ class ClaudeGenerator:
         self.model = "claude-sonnet-4-20250514"
     
     def generate(self, prompt: str, options: Dict = None) -> str:
+        return "".join(self.generate_stream(prompt, options))
+    
+    def generate_stream(self, prompt: str, options: Dict = None) -> Iterator[str]:
+        """Yield the feature text in chunks as it is produced"""
         options = options or {}
+        use_api = bool(self.api_key) and (HAS_ANTHROPIC or HAS_REQUESTS)
+        
+        key = self._response_key(prompt, options, use_api)
+        cached = _response_cache().get(key)
+        if cached is not None:
+            yield cached
+            return
         
         system = self._build_system_prompt(options)
         user = self._build_user_prompt(prompt, options)
         
-        if self.api_key and (HAS_ANTHROPIC or HAS_REQUESTS):
-            return self._call_claude(system, user)
+        if use_api:
+            chunks = []
+            for chunk in self._call_claude(system, user):
+                chunks.append(chunk)
+                yield chunk
+            # _call_claude reports failures as a separate "# ...Error" chunk
+            if not any(c.startswith(_ERROR_PREFIXES) for c in chunks):
+                _response_cache().put(key, "".join(chunks))
         else:
-            return self._fallback_generate(prompt, options)
+            feature = self._fallback_generate(prompt, options)
+            _response_cache().put(key, feature)
+            yield feature
     
-    def _build_system_prompt(self, options: Dict) -> str:
-        prompt = """You are an expert Karate test framework developer. Your task is to generate Karate feature files that EXACTLY match the patterns and style learned from the user's repository.
+    def _response_key(self, prompt: str, options: Dict, use_api: bool) -> bytes:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(prompt.encode())
+        h.update(json.dumps(options, sort_keys=True).encode())
+        h.update(self.scanner.version)
+        h.update(f"|{self.model}|{use_api}".encode())
+        return h.digest()
+    
+    # The system prompt is two blocks: the fixed instructions + KB, which never change,
+    # then the learned repository context, which changes per scan
+    _SYSTEM_KB_TEMPLATE = """You are an expert Karate test framework developer. Your task is to generate Karate feature files that EXACTLY match the patterns and style learned from the user's repository.
 
 CRITICAL RULES:
 1. Follow the EXACT patterns from the learned repository
@@ -641,16 +930,11 @@ CRITICAL RULES:
 6. Use the SAME call patterns for common scenarios
 7. Generate tags that match the repository's tagging conventions
 
+{kb_context}
+
 """
-        # Add knowledge base context
-        prompt += self.kb.get_context()
-        prompt += "\n\n"
-        
-        # Add learned patterns from repository
-        if self.scanner.scenarios:
-            prompt += self.scanner.get_context_for_claude(max_examples=5)
-        
-        prompt += """
+    
+    _SYSTEM_REPO_TEMPLATE = """{repo_context}
 
 OUTPUT RULES:
 1. Return ONLY the Karate feature file content
@@ -659,56 +943,114 @@ OUTPUT RULES:
 4. Do NOT include explanations
 5. Match the exact style from the repository examples
 """
-        return prompt
+    
+    def _build_system_prompt(self, options: Dict) -> List[str]:
+        """System prompt blocks, most stable first"""
+        # Learned patterns from repository, if any were scanned
+        repo_context = self.scanner.get_context_for_claude(max_examples=5) if self.scanner.scenarios else ""
+        
+        return [
+            self._SYSTEM_KB_TEMPLATE.format(kb_context=self.kb.get_context()),
+            self._SYSTEM_REPO_TEMPLATE.format(repo_context=repo_context),
+        ]
     
     def _build_user_prompt(self, prompt: str, options: Dict) -> str:
-        user = f"Generate a Karate feature file for: {prompt}\n\n"
+        parts = [f"Generate a Karate feature file for: {prompt}\n\n"]
         
         # Find similar scenarios
         if self.scanner.scenarios:
             similar = self.scanner.find_similar_scenarios(prompt, limit=2)
             if similar:
-                user += "Reference these similar scenarios from the repository for style:\n"
+                parts.append("Reference these similar scenarios from the repository for style:\n")
                 for s in similar:
-                    user += f"\n--- {s.name} ---\n{s.content[:500]}\n"
+                    parts.append(f"\n--- {s.name} ---\n{s.content[:500]}\n")
         
-        user += f"\nOptions:\n- Include SQL: {options.get('sql', True)}\n- Use common calls: {options.get('common', True)}\n"
+        parts.append(f"\nOptions:\n- Include SQL: {options.get('sql', True)}\n- Use common calls: {options.get('common', True)}\n")
         
-        return user
+        return "".join(parts)
+    
+    @staticmethod
+    def _cached_system(system: List[str]) -> List[Dict]:
+        """System blocks with one cache breakpoint, after the last block"""
+        # The KB block alone (~350 tokens) is under the 1024-token cacheable minimum, so
+        # a breakpoint after it would never hit; an unscanned prompt may not cache at all
+        blocks = [{"type": "text", "text": text} for text in system]
+        blocks[-1]["cache_control"] = {"type": "ephemeral"}
+        return blocks
+    
+    @staticmethod
+    def _log_cache_usage(read: Optional[int], written: Optional[int]):
+        logging.debug("Prompt cache: %d tokens read, %d tokens written", read or 0, written or 0)
     
-    def _call_claude(self, system: str, user: str) -> str:
+    def _call_claude(self, system: List[str], user: str) -> Iterator[str]:
+        streamed = False
+        usage = None  # (cache read, cache written) token counts
         try:
             if HAS_ANTHROPIC:
-                client = anthropic.Anthropic(api_key=self.api_key)
-                response = client.messages.create(
+                client = _anthropic_client(self.api_key)
+                with client.messages.stream(
                     model=self.model,
                     max_tokens=4096,
-                    system=system,
+                    system=self._cached_system(system),
                     messages=[{"role": "user", "content": user}]
-                )
-                return response.content[0].text
+                ) as stream:
+                    for text in stream.text_stream:
+                        streamed = True
+                        yield text
+                    final = stream.get_final_message().usage
+                    usage = (final.cache_read_input_tokens, final.cache_creation_input_tokens)
             elif HAS_REQUESTS:
-                response = requests.post(
-                    "https://api.anthropic.com/v1/messages",
-                    headers={
-                        "x-api-key": self.api_key,
-                        "anthropic-version": "2023-06-01",
-                        "content-type": "application/json"
-                    },
-                    json={
-                        "model": self.model,
-                        "max_tokens": 4096,
-                        "system": system,
-                        "messages": [{"role": "user", "content": user}]
-                    },
-                    timeout=60
-                )
-                if response.status_code == 200:
-                    return response.json()["content"][0]["text"]
-                else:
-                    return f"# API Error: {response.status_code}\n{self._fallback_generate(user, {})}"
+                with _http_session() as session:
+                    response = session.post(
+                        "https://api.anthropic.com/v1/messages",
+                        headers={"x-api-key": self.api_key},
+                        json={
+                            "model": self.model,
+                            "max_tokens": 4096,
+                            "system": self._cached_system(system),
+                            "messages": [{"role": "user", "content": user}],
+                            "stream": True
+                        },
+                        stream=True,
+                        timeout=60
+                    )
+                    with response:
+                        if response.status_code != 200:
+                            yield f"# API Error: {response.status_code}\n{self._fallback_generate(user, {})}"
+                            return
+                        # Server-sent events: only the "data: {...}" lines carry payloads
+                        for line in response.iter_lines():
+                            if not line.startswith(b"data: "):
+                                continue
+                            event = _loads(line[6:])
+                            if event["type"] == "content_block_delta" and event["delta"]["type"] == "text_delta":
+                                streamed = True
+                                yield event["delta"]["text"]
+                            elif event["type"] == "message_start":
+                                start = event["message"].get("usage", {})
+                                usage = (start.get("cache_read_input_tokens"), start.get("cache_creation_input_tokens"))
+                            elif event["type"] == "message_stop":
+                                break
+                            elif event["type"] == "error":
+                                error = event.get("error", {})
+                                yield "\n"
+                                yield f"# API Error: {error.get('type', 'error')}: {error.get('message', '')}\n"
+                                return
+                        else:
+                            # Error chunks keep a partial feature out of the response cache
+                            yield "\n"
+                            yield "# API Error: stream ended before message_stop\n"
+                            return
         except Exception as e:
-            return f"# Error: {e}\n{self._fallback_generate(user, {})}"
+            if streamed:
+                # Leave the partial text as it is; appending a fallback feature would garble it
+                yield "\n"
+                yield f"# Error: {e}\n"
+            else:
+                yield f"# Error: {e}\n{self._fallback_generate(user, {})}"
+            return
+        if usage is not None:
+            self._log_cache_usage(*usage)
     
     def _fallback_generate(self, prompt: str, options: Dict) -> str:
         """Fallback using learned patterns"""
@@ -719,28 +1061,30 @@ OUTPUT RULES:
             similar = self.scanner.find_similar_scenarios(prompt, limit=1)
             if similar:
                 base = similar[0]
-                # Modify the similar scenario
-                result = f"# Generated based on: {base.name}\n"
-                result += f"# From: {base.file_path}\n\n"
-                
                 # Use its structure but modify
                 content = base.content
                 # Simple modifications based on prompt
                 if 'approved' in p and base.response_code != '00':
-                    content = re.sub(r"DE39.*?==.*?'\d+'", "DE39' == '00'", content)
+                    content = _DE39_ASSERT_RE.sub("DE39' == '00'", content)
                 
-                return f"@generated @ai\nFeature: Generated Test\n\n  Scenario: {prompt[:50]}\n{content}"
+                return _FALLBACK_FROM_SIMILAR.format_map({"title": prompt[:50], "content": content})
         
         # Default minimal generation
-        return f"""@generated
-Feature: {prompt[:50]}
+        return _FALLBACK_DEFAULT.format_map({"title": prompt[:50]})
+
+
+# Fallback feature bodies, filled with str.format_map
+_FALLBACK_FROM_SIMILAR = "@generated @ai\nFeature: Generated Test\n\n  Scenario: {title}\n{content}"
+
+_FALLBACK_DEFAULT = """@generated
+Feature: {title}
 
   Background:
     * url cosmosUrl
     * def templateName = 'fwd_visasig_direct_purchase_0100'
 
   Scenario: Generated Test
-    * def stan = Math.floor(Math.random() * 999999).toString().padStart(6, '0')
+    * def stan = (Math.random() * 999999 | 0).toString().padStart(6, '0')
     * def rrn = Math.floor(Math.random() * 999999999999).toString().padStart(12, '0')
     
     Given path '/template'
@@ -756,10 +1100,15 @@ Feature: {prompt[:50]}
 
 st.set_page_config(page_title="AI Karate Generator", page_icon="🥋", layout="wide")
 
-st.markdown("""
-<style>
-@import url('https://fonts.googleapis.com/css2?family=Plus+Jakarta+Sans:wght@400;500;600;700;800&family=JetBrains+Mono&display=swap');
+# Loaded via <link> rather than a CSS @import, which blocks parsing of the rest of the
+# stylesheet until the font CSS arrives. Only the weights the stylesheet uses are requested.
+_FONT_LINKS = (
+    '<link rel="preconnect" href="https://fonts.googleapis.com">'
+    '<link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>'
+    '<link rel="stylesheet" href="https://fonts.googleapis.com/css2?family=Plus+Jakarta+Sans:wght@400;600;700;800&display=swap">'
+)
 
+_CSS_RAW = """
 :root {
     --primary: #7C3AED;
     --success: #10B981;
@@ -779,6 +1128,7 @@ st.markdown("""
     text-align: center;
     color: white;
     margin-bottom: 2rem;
+    contain: layout paint;
 }
 .header h1 { font-size: 2.5rem; font-weight: 800; margin: 0; }
 .header p { opacity: 0.9; margin-top: 0.5rem; }
@@ -795,6 +1145,7 @@ st.markdown("""
     padding: 1rem;
     text-align: center;
     border: 1px solid #E2E8F0;
+    contain: content;
 }
 .stat-num {
     font-size: 1.75rem;
@@ -811,6 +1162,7 @@ st.markdown("""
     padding: 1.5rem;
     border: 1px solid #E2E8F0;
     margin: 1rem 0;
+    contain: content;
 }
 
 .section-title {
@@ -829,6 +1181,11 @@ st.markdown("""
     border-radius: 100px;
     font-size: 0.75rem;
     margin: 0.125rem;
+    contain: content;
+}
+.tag-cloud {
+    content-visibility: auto;
+    contain-intrinsic-size: auto 120px;
 }
 
 .stTabs [data-baseweb="tab-list"] {
@@ -855,48 +1212,177 @@ st.markdown("""
     font-weight: 700;
     padding: 0.625rem 1.25rem;
 }
-</style>
-""", unsafe_allow_html=True)
+"""
+
+
+@st.cache_resource
+def _get_minified_css() -> str:
+    """Strip comments and collapse whitespace once per server process, not per rerun"""
+    css = re.sub(r"/\*.*?\*/", "", _CSS_RAW, flags=re.S)
+    return re.sub(r"\s+", " ", css).strip()
+
+
+# Streamlit drops any element a rerun does not re-emit, so the styles are sent on
+# every run. st.html skips the markdown pipeline, but it sanitizes away <link> tags,
+# so the font links stay in a tiny markdown block
+st.markdown(_FONT_LINKS, unsafe_allow_html=True)
+st.html(f"<style>{_get_minified_css()}</style>")
+
+
+_TABS = ("📁 Scan Repository", "✨ Generate", "📊 Learned Patterns", "🔑 API Key", "💾 Export/Import")
+
+_SCAN_UPLOAD_TYPES = ("feature", "txt", "zip")
+_IMPORT_UPLOAD_TYPES = ("json",)
+
+# Quick examples
+_EXAMPLES = (
+    "E2E approved Visa purchase with SQL validation",
+    "Declined transaction due to insufficient funds",
+    "ATM withdrawal for $500",
+    "MasterCard refund with reversal",
+    "Expired card decline scenario",
+)
+_EXAMPLE_LABELS = {ex: f"📝 {ex[:20]}..." for ex in _EXAMPLES}
+
+# Generation option key -> label; all are on by default
+_GENERATE_OPTIONS = {
+    "sql": "🗄️ Include SQL Validation",
+    "common": "🔗 Use Common Scenarios",
+    "match_style": "🎨 Match Repository Style",
+}
+
+_HEADER_HTML = '''
+<div class="header">
+    <h1>🥋 AI Karate Generator</h1>
+    <p>Scan your ENTIRE repository • Learn ALL patterns • Generate matching tests</p>
+</div>
+'''
+
+
+# cache_resource, not cache_data: the same instance is handed back without being
+# pickled or hashed, so its memoized context survives across reruns and sessions
+@st.cache_resource
+def get_knowledge_base() -> KnowledgeBase:
+    """One read-only knowledge base shared by every session"""
+    return KnowledgeBase()
+
+
+def _stats_html(files: int, scenarios: int, steps: int, sql: int, tags: int, templates: int) -> str:
+    """Stats row markup; a plain f-string is cheaper than any cache lookup for it"""
+    return f'''
+    <div class="stats-row">
+        <div class="stat-box"><div class="stat-num">{files}</div><div class="stat-label">Files Scanned</div></div>
+        <div class="stat-box"><div class="stat-num">{scenarios}</div><div class="stat-label">Scenarios</div></div>
+        <div class="stat-box"><div class="stat-num">{steps}</div><div class="stat-label">Step Patterns</div></div>
+        <div class="stat-box"><div class="stat-num">{sql}</div><div class="stat-label">SQL Patterns</div></div>
+        <div class="stat-box"><div class="stat-num">{tags}</div><div class="stat-label">Tags</div></div>
+        <div class="stat-box"><div class="stat-num">{templates}</div><div class="stat-label">Templates</div></div>
+    </div>
+    '''
+
+
+# Above this size browser-side highlighting costs more than it helps
+_HIGHLIGHT_LIMIT = 4000
+
+
+def _show_feature(target, feature: str):
+    """Render feature text into a placeholder, highlighted only while it is small"""
+    if len(feature) < _HIGHLIGHT_LIMIT:
+        target.code(feature, language="gherkin")
+    else:
+        target.text(feature)
+
+
+@st.fragment
+def _generate_tab(scanner: RepositoryScanner, kb: KnowledgeBase):
+    """Generate tab; its widgets rerun only this fragment, not the whole app"""
+    st.html('<div class="section-title">✨ Generate Tests Using Learned Patterns</div>')
+    
+    if not scanner.scenarios:
+        st.warning("⚠️ Please scan your repository first in the 'Scan Repository' tab")
+    
+    # One pills widget instead of a column + button per example
+    picked = st.pills(
+        "Quick examples", _EXAMPLES,
+        format_func=_EXAMPLE_LABELS.get,
+        key="example_pick",
+        label_visibility="collapsed"
+    )
+    if picked:
+        st.session_state.prompt = picked
+    
+    # A form so editing the prompt or toggling options doesn't rerun the script
+    with st.form("generate_form"):
+        prompt = st.text_area(
+            "Describe the test you want",
+            value=st.session_state.get('prompt', ''),
+            height=100,
+            placeholder="Example: Write an E2E test for declined purchase due to expired card with full SQL validation"
+        )
+        
+        chosen = st.segmented_control(
+            "Options", _GENERATE_OPTIONS,
+            format_func=_GENERATE_OPTIONS.get,
+            selection_mode="multi",
+            default=tuple(_GENERATE_OPTIONS),
+            label_visibility="collapsed"
+        )
+        
+        submitted = st.form_submit_button("🚀 Generate with Claude AI", type="primary", use_container_width=True)
+    
+    if submitted:
+        if prompt:
+            generator = ClaudeGenerator(st.session_state.api_key, kb, scanner)
+            
+            status = st.status("🤖 Generating test matching your repository style...")
+            output = st.empty()
+            feature = ""
+            rendered = 0
+            for chunk in generator.generate_stream(prompt, {key: key in chosen for key in _GENERATE_OPTIONS}):
+                feature += chunk
+                # Re-highlighting the whole block per token is quadratic; refresh in steps
+                if len(feature) - rendered >= 200:
+                    _show_feature(output, feature)
+                    rendered = len(feature)
+            _show_feature(output, feature)
+            status.update(label="✅ Generated!", state="complete")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                st.download_button("📥 Download .feature", feature.encode(), "generated_test.feature", use_container_width=True)
+    
+    # Show similar scenarios
+    if prompt and scanner.scenarios:
+        with st.expander("📚 Similar Scenarios in Your Repository"):
+            similar = scanner.find_similar_scenarios(prompt)
+            for s in similar:
+                st.markdown(f"**{s.name}** ({s.file_path})")
+                st.code(s.content[:300] + "...", language="gherkin")
 
 
 def main():
-    if 'scanner' not in st.session_state:
-        st.session_state.scanner = RepositoryScanner()
-    if 'kb' not in st.session_state:
-        st.session_state.kb = KnowledgeBase()
-    if 'api_key' not in st.session_state:
-        st.session_state.api_key = ""
+    # get() first so a RepositoryScanner is only constructed on a session's first run
+    scanner = st.session_state.get('scanner') or st.session_state.setdefault('scanner', RepositoryScanner())
+    st.session_state.setdefault('api_key', "")
     
-    scanner = st.session_state.scanner
-    kb = st.session_state.kb
+    kb = get_knowledge_base()
     summary = scanner.get_summary()
     
     # Header
-    st.markdown('''
-    <div class="header">
-        <h1>🥋 AI Karate Generator</h1>
-        <p>Scan your ENTIRE repository • Learn ALL patterns • Generate matching tests</p>
-    </div>
-    ''', unsafe_allow_html=True)
+    st.html(_HEADER_HTML)
     
     # Stats
-    st.markdown(f'''
-    <div class="stats-row">
-        <div class="stat-box"><div class="stat-num">{summary["total_files"]}</div><div class="stat-label">Files Scanned</div></div>
-        <div class="stat-box"><div class="stat-num">{summary["total_scenarios"]}</div><div class="stat-label">Scenarios</div></div>
-        <div class="stat-box"><div class="stat-num">{summary["unique_steps"]}</div><div class="stat-label">Step Patterns</div></div>
-        <div class="stat-box"><div class="stat-num">{summary["sql_queries"]}</div><div class="stat-label">SQL Patterns</div></div>
-        <div class="stat-box"><div class="stat-num">{summary["unique_tags"]}</div><div class="stat-label">Tags</div></div>
-        <div class="stat-box"><div class="stat-num">{len(summary["templates_used"])}</div><div class="stat-label">Templates</div></div>
-    </div>
-    ''', unsafe_allow_html=True)
+    st.html(_stats_html(
+        summary["total_files"], summary["total_scenarios"], summary["unique_steps"],
+        summary["sql_queries"], summary["unique_tags"], len(summary["templates_used"])
+    ))
     
     # Tabs
-    tab1, tab2, tab3, tab4, tab5 = st.tabs(["📁 Scan Repository", "✨ Generate", "📊 Learned Patterns", "🔑 API Key", "💾 Export/Import"])
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(_TABS)
     
     # ========== TAB 1: SCAN ==========
     with tab1:
-        st.markdown('<div class="section-title">📁 Scan Your Feature Files</div>', unsafe_allow_html=True)
+        st.html('<div class="section-title">📁 Scan Your Feature Files</div>')
         
         col1, col2 = st.columns(2)
         
@@ -905,7 +1391,7 @@ def main():
             st.markdown("#### 📤 Upload Feature Files")
             uploaded = st.file_uploader(
                 "Upload .feature files or a ZIP of your repository",
-                type=["feature", "txt", "zip"],
+                type=_SCAN_UPLOAD_TYPES,
                 accept_multiple_files=True
             )
             
@@ -913,19 +1399,20 @@ def main():
                 if uploaded:
                     progress = st.progress(0)
                     status = st.empty()
+                    on_progress = lambda p, m: (progress.progress(p), status.text(m))
                     
+                    # Loose feature files go through one batch; each ZIP is its own batch
+                    results = scanner.scan_uploaded_files(
+                        [f for f in uploaded if not f.name.endswith('.zip')], on_progress
+                    )
+                    scanned = results["files"]
                     for file in uploaded:
                         if file.name.endswith('.zip'):
-                            results = scanner.scan_zip_file(
-                                io.BytesIO(file.read()),
-                                lambda p, m: (progress.progress(p), status.text(m))
-                            )
-                        else:
-                            content = file.read().decode('utf-8')
-                            results = scanner.scan_pasted_content(content, file.name)
+                            results = scanner.scan_zip_file(file, on_progress)
+                            scanned += results["files"]
                     
                     progress.progress(1.0)
-                    st.success(f"✅ Scanned {results['files']} files, found {results['scenarios']} scenarios!")
+                    st.success(f"✅ Scanned {scanned} files, found {results['scenarios']} scenarios!")
                     st.rerun()
             st.markdown('</div>', unsafe_allow_html=True)
         
@@ -962,70 +1449,11 @@ def main():
     
     # ========== TAB 2: GENERATE ==========
     with tab2:
-        st.markdown('<div class="section-title">✨ Generate Tests Using Learned Patterns</div>', unsafe_allow_html=True)
-        
-        if not scanner.scenarios:
-            st.warning("⚠️ Please scan your repository first in the 'Scan Repository' tab")
-        
-        # Quick examples
-        examples = [
-            "E2E approved Visa purchase with SQL validation",
-            "Declined transaction due to insufficient funds",
-            "ATM withdrawal for $500",
-            "MasterCard refund with reversal",
-            "Expired card decline scenario",
-        ]
-        
-        cols = st.columns(5)
-        for i, ex in enumerate(examples):
-            with cols[i]:
-                if st.button(f"📝 {ex[:20]}...", key=f"ex{i}", use_container_width=True):
-                    st.session_state.prompt = ex
-        
-        prompt = st.text_area(
-            "Describe the test you want",
-            value=st.session_state.get('prompt', ''),
-            height=100,
-            placeholder="Example: Write an E2E test for declined purchase due to expired card with full SQL validation"
-        )
-        
-        col1, col2, col3 = st.columns(3)
-        with col1:
-            include_sql = st.checkbox("🗄️ Include SQL Validation", value=True)
-        with col2:
-            use_common = st.checkbox("🔗 Use Common Scenarios", value=True)
-        with col3:
-            match_style = st.checkbox("🎨 Match Repository Style", value=True)
-        
-        if st.button("🚀 Generate with Claude AI", type="primary", use_container_width=True):
-            if prompt:
-                generator = ClaudeGenerator(st.session_state.api_key, kb, scanner)
-                
-                with st.spinner("🤖 Generating test matching your repository style..."):
-                    feature = generator.generate(prompt, {
-                        "sql": include_sql,
-                        "common": use_common,
-                        "match_style": match_style
-                    })
-                
-                st.success("✅ Generated!")
-                st.code(feature, language="gherkin")
-                
-                col1, col2 = st.columns(2)
-                with col1:
-                    st.download_button("📥 Download .feature", feature, "generated_test.feature", use_container_width=True)
-        
-        # Show similar scenarios
-        if prompt and scanner.scenarios:
-            with st.expander("📚 Similar Scenarios in Your Repository"):
-                similar = scanner.find_similar_scenarios(prompt)
-                for s in similar:
-                    st.markdown(f"**{s.name}** ({s.file_path})")
-                    st.code(s.content[:300] + "...", language="gherkin")
+        _generate_tab(scanner, kb)
     
     # ========== TAB 3: PATTERNS ==========
     with tab3:
-        st.markdown('<div class="section-title">📊 Learned Patterns from Your Repository</div>', unsafe_allow_html=True)
+        st.html('<div class="section-title">📊 Learned Patterns from Your Repository</div>')
         
         if not scanner.scenarios:
             st.info("Scan your repository to see learned patterns")
@@ -1034,27 +1462,31 @@ def main():
             
             with col1:
                 st.markdown("#### 🏷️ Tags Used")
-                tags_html = ""
-                for p in sorted(scanner.patterns["tags"], key=lambda x: -x.frequency)[:20]:
-                    tags_html += f'<span class="pattern-tag">@{p.content} ({p.frequency}x)</span> '
-                st.markdown(f'<div>{tags_html}</div>', unsafe_allow_html=True)
+                tags_html = "".join(
+                    f'<span class="pattern-tag">@{p.content} ({p.frequency}x)</span> '
+                    for p in scanner.top_patterns("tags", 20)
+                )
+                st.html(f'<div class="tag-cloud">{tags_html}</div>')
                 
-                st.markdown("#### 📄 Templates Used")
-                for template, count in scanner.templates_used.most_common(10):
-                    st.markdown(f"- `{template}`: {count} times")
+                # One element per list rather than one per row
+                st.markdown("#### 📄 Templates Used\n" + "\n".join(
+                    f"- `{template}`: {count} times" for template, count in scanner.templates_used.most_common(10)
+                ))
                 
-                st.markdown("#### 🔢 Response Codes")
-                for rc, count in scanner.response_codes_used.most_common(10):
-                    st.markdown(f"- RC `{rc}`: {count} times")
+                st.markdown("#### 🔢 Response Codes\n" + "\n".join(
+                    f"- RC `{rc}`: {count} times" for rc, count in scanner.response_codes_used.most_common(10)
+                ))
             
             with col2:
                 st.markdown("#### 📝 Common Step Patterns")
-                for p in sorted(scanner.patterns["steps"], key=lambda x: -x.frequency)[:10]:
-                    st.code(f"({p.frequency}x) {p.content[:80]}")
+                steps = scanner.top_patterns("steps", 10)
+                if steps:
+                    st.code("\n".join(f"({p.frequency}x) {p.content[:80]}" for p in steps))
                 
                 st.markdown("#### 🗄️ SQL Patterns")
-                for p in sorted(scanner.patterns["sql_queries"], key=lambda x: -x.frequency)[:5]:
-                    st.code(p.content[:100])
+                sql_patterns = scanner.top_patterns("sql_queries", 5)
+                if sql_patterns:
+                    st.code("\n".join(p.content[:100] for p in sql_patterns))
             
             st.markdown("---")
             st.markdown("#### 📚 Sample Learned Scenarios")
@@ -1066,7 +1498,7 @@ def main():
     
     # ========== TAB 4: API KEY ==========
     with tab4:
-        st.markdown('<div class="section-title">🔑 Claude API Configuration</div>', unsafe_allow_html=True)
+        st.html('<div class="section-title">🔑 Claude API Configuration</div>')
         
         st.markdown('<div class="card">', unsafe_allow_html=True)
         api_key = st.text_input("Anthropic API Key", value=st.session_state.api_key, type="password")
@@ -1079,7 +1511,7 @@ def main():
     
     # ========== TAB 5: EXPORT ==========
     with tab5:
-        st.markdown('<div class="section-title">💾 Export / Import Learned Data</div>', unsafe_allow_html=True)
+        st.html('<div class="section-title">💾 Export / Import Learned Data</div>')
         
         col1, col2 = st.columns(2)
         
@@ -1094,11 +1526,23 @@ def main():
         with col2:
             st.markdown('<div class="card">', unsafe_allow_html=True)
             st.markdown("#### 📥 Import")
-            uploaded_data = st.file_uploader("Upload learned data", type=["json"])
+            uploaded_data = st.file_uploader("Upload learned data", type=_IMPORT_UPLOAD_TYPES)
             if uploaded_data and st.button("Import", use_container_width=True):
-                scanner.import_learned_data(uploaded_data.read().decode('utf-8'))
-                st.success("✅ Imported!")
-                st.rerun()
+                try:
+                    # Parsed straight from bytes; exports are UTF-8, which is all orjson accepts
+                    raw = uploaded_data.read()
+                    # Cheap rejection of non-object uploads before invoking the parser
+                    # (this also rejects BOM-prefixed or UTF-16 files)
+                    if not raw.lstrip().startswith(b'{'):
+                        raise ValueError("expected a JSON object")
+                    scanner.import_learned_data(raw)
+                except ValueError as e:  # covers JSON and UTF-8 decode errors
+                    st.error(f"Invalid learned-data file: {e}")
+                except (KeyError, TypeError) as e:  # valid JSON, wrong shape
+                    st.error(f"Learned-data file has an unexpected layout: {e!r}")
+                else:
+                    st.success("✅ Imported!")
+                    st.rerun()
             st.markdown('</div>', unsafe_allow_html=True)
 
 